@@ -4,15 +4,254 @@ Kalman Filter
 """
 
 from abc import ABC
+from contextlib import contextmanager
 
-from typing import Optional
+from typing import Optional, Sequence, Union
 from filterpy.kalman import KalmanFilter as FpKalmanFilter
-from copy import deepcopy
 import numpy as np
 
 from darts.models.filtering.filtering_model import FilteringModel
 from darts.timeseries import TimeSeries
 from darts.utils.utils import raise_if_not
+from darts.logging import get_logger, raise_log
+
+logger = get_logger(__name__)
+
+try:
+    from numba import njit
+except ImportError:
+    def njit(*args, **kwargs):
+        """ numba is not available; the Kalman recursion runs as regular (non-compiled) NumPy code. """
+        return lambda func: func
+
+
+def _as_matrix(m, shape, dtype, scalar_as_identity):
+    """ Returns the filter matrix `m` as a (writable, contiguous) array of the given 2-D `shape`, interpreting it
+    the same way as filterpy. filterpy only multiplies `F`, `H` and `P` with `np.dot()`, so a scalar acts there as
+    a multiple of the identity (`scalar_as_identity`); whereas `Q` and `R` are added to other matrices, so they are
+    broadcast over the whole matrix.
+    """
+    m = np.asarray(m, dtype=dtype)
+    if scalar_as_identity and m.ndim == 0:
+        return m * np.eye(*shape, dtype=dtype)
+    return np.broadcast_to(m, shape).copy()
+
+
+@njit(cache=True)
+def _kf_step(x, P, F, Q, H, R, alpha_sq, z):
+    """ Performs one predict + update step of the Kalman filter, and returns the posterior state mean
+    and covariance.
+
+    The state means `x` (of shape (dim_x, n_series)) and observations `z` (of shape (dim_z, n_series)) hold one
+    column per series; the covariance `P` doesn't depend on the observations, so it is shared by all the series.
+    """
+    # predict
+    x = np.dot(F, x)
+    P = alpha_sq * np.dot(np.dot(F, P), F.T) + Q
+
+    # update
+    y = z - np.dot(H, x)
+    # H.P is computed once, and shared by the innovation covariance and the gain
+    HP = np.dot(H, P)
+    S = np.dot(HP, H.T) + R
+    # K = P.H'.inv(S), obtained by solving S.K' = H.P (P and S being symmetric) rather than inverting S
+    K = np.ascontiguousarray(np.linalg.solve(S, HP).T)
+    x = x + np.dot(K, y)
+
+    # Joseph form P = (I-KH)P(I-KH)' + KRK'; unlike P = (I-KH)P, it keeps P symmetric positive-definite,
+    # which makes it possible to run the filter in single precision.
+    I_KH = -np.dot(K, H)
+    for k in range(I_KH.shape[0]):
+        I_KH[k, k] += 1
+    P = np.dot(np.dot(I_KH, P), I_KH.T) + np.dot(np.dot(K, R), K.T)
+
+    return x, P
+
+
+@njit(cache=True)
+def _kf_step_sequential(x, P, F, Q, H, R, alpha_sq, z):
+    """ Same as `_kf_step()`, but assuming a diagonal measurement noise covariance `R`.
+
+    The measurements are then independent given the state, and they are assimilated one at a time
+    (sequential processing), which replaces the inverse of the (dim_z, dim_z) innovation covariance
+    by `dim_z` scalar divisions.
+    """
+    # predict
+    x = np.dot(F, x)
+    P = alpha_sq * np.dot(np.dot(F, P), F.T) + Q
+
+    # update, one measurement at a time
+    for j in range(H.shape[0]):
+        PHj = np.dot(P, H[j])
+        s = np.dot(H[j], PHj) + R[j, j]
+        K = PHj / s
+        x = x + np.outer(K, z[j] - np.dot(H[j], x))
+
+        # Joseph form of the covariance update (see `_kf_step()`)
+        I_KH = -np.outer(K, H[j])
+        for k in range(I_KH.shape[0]):
+            I_KH[k, k] += 1
+        P = np.dot(np.dot(I_KH, P), I_KH.T) + R[j, j] * np.outer(K, K)
+
+    return x, P
+
+
+@njit(cache=True)
+def _steady_state_gain(P, F, Q, H, R, alpha_sq):
+    """ Returns the Kalman gain `K` obtained from the posterior state covariance `P`, and the matrix `A` such that
+    a predict + update step with a fixed gain `K` is `x = A.x + K.z`.
+    """
+    P = alpha_sq * np.dot(np.dot(F, P), F.T) + Q
+    HP = np.dot(H, P)
+    S = np.dot(HP, H.T) + R
+    K = np.ascontiguousarray(np.linalg.solve(S, HP).T)
+    A = F - np.dot(np.dot(K, H), F)
+    return K, A
+
+
+@njit(cache=True)
+def _run_kf(z_values, F, Q, H, R, alpha_sq, x_init, P_init, store_covs, sequential, steady_state_tol):
+    """ Runs the Kalman filter over all the observations `z_values` (of shape (n_timesteps, dim_z, n_series)).
+    If `sequential` is True, `R` must be diagonal and the measurements are processed one at a time.
+
+    All the series share the same model and initial state `x_init`, so they are filtered together: each step
+    is a matrix product over all the series at once, and the covariance recursion is only done once.
+
+    The model being time-invariant, the state covariance (and so the Kalman gain) converges to a fixed point.
+    Once the relative change of the state covariance over a step goes below `steady_state_tol`, the gain is frozen,
+    and the covariance updates are skipped for the remaining steps.
+
+    Returns the posterior state means (of shape (n_timesteps, dim_x, n_series)) and, if `store_covs` is True,
+    the posterior state covariances (of shape (n_timesteps, dim_x, dim_x)). Otherwise the returned covariances
+    array is empty.
+    """
+    n_timesteps, dim_x, n_series = z_values.shape[0], x_init.shape[0], z_values.shape[2]
+    means = np.empty((n_timesteps, dim_x, n_series), dtype=x_init.dtype)
+    covs = np.empty((n_timesteps if store_covs else 0, dim_x, dim_x), dtype=x_init.dtype)
+
+    x = np.empty((dim_x, n_series), dtype=x_init.dtype)
+    for b in range(n_series):
+        x[:, b] = x_init
+    P = P_init
+    steady_state = False
+    K_inf, A_inf = np.zeros((dim_x, H.shape[0]), dtype=x_init.dtype), np.zeros_like(F)
+    for i in range(n_timesteps):
+        if steady_state:
+            x = np.dot(A_inf, x) + np.dot(K_inf, z_values[i])
+        else:
+            P_prev = P
+            if sequential:
+                x, P = _kf_step_sequential(x, P, F, Q, H, R, alpha_sq, z_values[i])
+            else:
+                x, P = _kf_step(x, P, F, Q, H, R, alpha_sq, z_values[i])
+
+            if np.max(np.abs(P - P_prev)) <= steady_state_tol * np.max(np.abs(P)):
+                steady_state = True
+                K_inf, A_inf = _steady_state_gain(P, F, Q, H, R, alpha_sq)
+
+        means[i] = x
+        if store_covs:
+            covs[i] = P
+
+    return means, covs
+
+
+def _jax_precision(jax, enable_x64: bool):
+    """ Returns a context manager in which `jax` computes in double precision if `enable_x64` is True (and in single
+    precision otherwise). The way to switch the precision depends on the version of `jax`.
+    """
+    if callable(getattr(jax, 'enable_x64', None)):
+        # recent releases
+        return jax.enable_x64(enable_x64)
+    try:
+        from jax.experimental import enable_x64 as experimental_enable_x64
+        return experimental_enable_x64(enable_x64)
+    except ImportError:
+        pass
+
+    if not callable(getattr(getattr(jax, 'config', None), 'update', None)):
+        raise_log(ImportError(f'The installed version of `jax` ({jax.__version__}) does not provide a way to switch '
+                              f'between single and double precision, which the parallel Kalman filter requires.'),
+                  logger)
+
+    @contextmanager
+    def config_precision():
+        previous_enable_x64 = bool(jax.config.jax_enable_x64)
+        jax.config.update('jax_enable_x64', enable_x64)
+        try:
+            yield
+        finally:
+            jax.config.update('jax_enable_x64', previous_enable_x64)
+
+    return config_precision()
+
+
+def _run_kf_parallel(z_values, F, Q, H, R, x_init, P_init):
+    """ Same as `_run_kf()` (without fading memory and always returning the covariances), but using the parallel
+    formulation of the Kalman filter from [1]_: the filtering is expressed as an associative scan over elements
+    built independently for each time step, which has a parallel depth in O(log(n_timesteps)) instead
+    of O(n_timesteps). This requires `jax`, and is mostly beneficial for long series on GPU/TPU.
+
+    References
+    ----------
+    .. [1] S. Särkkä and Á. F. García-Fernández, "Temporal Parallelization of Bayesian Smoothers",
+           IEEE Transactions on Automatic Control, 2021.
+    """
+    try:
+        import jax
+        import jax.numpy as jnp
+    except ImportError:
+        raise_log(ImportError('The parallel Kalman filter requires `jax` to be installed.'), logger)
+
+    def first_element(z):
+        # the first step is conditioned on the initial state
+        m = jnp.dot(F, x_init)
+        P = jnp.dot(jnp.dot(F, P_init), F.T) + Q
+        HP = jnp.dot(H, P)
+        S = jnp.dot(HP, H.T) + R
+        K = jnp.linalg.solve(S, HP).T
+        A = jnp.zeros_like(F)
+        b = m + jnp.dot(K, z - jnp.dot(H, m))
+        C = P - jnp.dot(jnp.dot(K, S), K.T)
+        return A, b, C, jnp.zeros_like(F), jnp.zeros_like(x_init)
+
+    def generic_element(z):
+        HQ = jnp.dot(H, Q)
+        S = jnp.dot(HQ, H.T) + R
+        K = jnp.linalg.solve(S, HQ).T
+        HF = jnp.dot(H, F)
+        A = F - jnp.dot(K, HF)
+        b = jnp.dot(K, z)
+        C = Q - jnp.dot(K, HQ)
+        eta = jnp.dot(HF.T, jnp.linalg.solve(S, z))
+        J = jnp.dot(HF.T, jnp.linalg.solve(S, HF))
+        return A, b, C, J, eta
+
+    def combine(elem_1, elem_2):
+        A_1, b_1, C_1, J_1, eta_1 = elem_1
+        A_2, b_2, C_2, J_2, eta_2 = elem_2
+        eye = jnp.eye(A_1.shape[0], dtype=A_1.dtype)
+
+        M = jnp.linalg.solve((eye + jnp.dot(C_1, J_2)).T, A_2.T).T
+        A = jnp.dot(M, A_1)
+        b = jnp.dot(M, b_1 + jnp.dot(C_1, eta_2)) + b_2
+        C = jnp.dot(jnp.dot(M, C_1), A_2.T) + C_2
+
+        N = jnp.linalg.solve((eye + jnp.dot(J_2, C_1)).T, A_1).T
+        eta = jnp.dot(N, eta_2 - jnp.dot(J_2, b_1)) + eta_1
+        J = jnp.dot(jnp.dot(N, J_2), A_1) + J_1
+        return A, b, C, J, eta
+
+    # jax works in single precision unless told otherwise
+    with _jax_precision(jax, z_values.dtype == np.float64):
+        F, Q, H, R, x_init, P_init, z_values = (jnp.asarray(m) for m in (F, Q, H, R, x_init, P_init, z_values))
+
+        first = first_element(z_values[0])
+        generic = jax.vmap(generic_element)(z_values[1:])
+        elements = tuple(jnp.concatenate([f[None], g]) for f, g in zip(first, generic))
+
+        _, means, covs, _, _ = jax.lax.associative_scan(jax.vmap(combine), elements)
+        return np.asarray(means), np.asarray(covs)
 
 
 class KalmanFilter(FilteringModel, ABC):
@@ -41,6 +280,8 @@ class KalmanFilter(FilteringModel, ABC):
 
         This implementation wraps around filterpy.kalman.KalmanFilter, so more information the parameters can be found
         here: https://filterpy.readthedocs.io/en/latest/kalman/KalmanFilter.html
+        The filter recursion itself is run on the raw matrices of the filter, and is JIT-compiled if `numba`
+        is installed.
 
         The dimensionality of the measurements z is automatically inferred upon calling `filter()`.
         This implementation doesn't include control signal.
@@ -66,8 +307,8 @@ class KalmanFilter(FilteringModel, ABC):
             in the underlying dynamical system.
         kf : filterpy.kalman.KalmanFilter
             Optionally, an instance of `filterpy.kalman.KalmanFilter`.
-            If this is provided, the other parameters are ignored. This instance will be copied for every
-            call to `filter()`, so the state is not carried over from one time series to another across several
+            If this is provided, the other parameters are ignored. This instance is only read (and never modified)
+            by `filter()`, so the state is not carried over from one time series to another across several
             calls to `filter()`.
             The various dimensionality in the filter must match those in the `TimeSeries` used when calling `filter()`.
         """
@@ -83,72 +324,128 @@ class KalmanFilter(FilteringModel, ABC):
             self.kf = None
             self.kf_provided = False
         else:
+            self.dim_x = kf.dim_x
             self.kf = kf
             self.kf_provided = True
 
     def __str__(self):
         return 'KalmanFilter(dim_x={})'.format(self.dim_x)
 
+    @staticmethod
+    def _cholesky(covs: np.ndarray) -> np.ndarray:
+        """ Returns the Cholesky factors of the stacked covariance matrices `covs` (of shape (n, dim_x, dim_x)).
+
+        All the matrices are factorized in one batched Cholesky call (much cheaper than the SVD done by
+        `np.random.multivariate_normal()` at each step); a small jitter is added on their diagonals to keep them
+        numerically positive-definite.
+        """
+        return np.linalg.cholesky(covs + 1e-12 * np.eye(covs.shape[1], dtype=covs.dtype))
+
     def filter(self,
-               series: TimeSeries,
-               num_samples: int = 1):
+               series: Union[TimeSeries, Sequence[TimeSeries]],
+               num_samples: int = 1,
+               parallel: bool = False) -> Union[TimeSeries, Sequence[TimeSeries]]:
         """
         Sequentially applies the Kalman filter on the provided series of observations.
 
         Parameters
         ----------
-        series : TimeSeries
+        series : TimeSeries or Sequence[TimeSeries]
             The series of observations used to infer the state values according to the specified Kalman process.
             This must be a deterministic series (containing one sample).
+            If the series contains `float32` values, the filter is run in single precision.
+            If a sequence of series is provided, each series is filtered independently (starting from the same
+            initial state), but all the series are processed together, which is much faster than filtering them
+            one by one. The series can have different lengths, but they must all have the same width `dim_z`.
+        num_samples : int, default: 1
+            The number of samples to generate from the inferred distribution of the states.
+        parallel : bool, default: False
+            Whether to run the parallel (associative scan) formulation of the Kalman filter, which requires `jax`.
+            It performs more operations overall, but it can be much faster on long series when running on an
+            accelerator (GPU/TPU). Fading memory (`alpha != 1`) is not supported in this mode.
 
         Returns
         -------
-        TimeSeries
-            A stochastic `TimeSeries` of state values, of dimension `dim_x`.
+        TimeSeries or Sequence[TimeSeries]
+            A stochastic `TimeSeries` of state values, of dimension `dim_x`, for each of the input series.
         """
 
-        raise_if_not(series.is_deterministic, 'The input series for the Kalman filter must be '
-                                              'deterministic (observations).')
+        called_with_single_series = False
+        if isinstance(series, TimeSeries):
+            called_with_single_series = True
+            series = [series]
+
+        raise_if_not(len(series) > 0, 'At least one series must be provided to the Kalman filter.', logger)
+        raise_if_not(all(s.is_deterministic for s in series), 'The input series for the Kalman filter must be '
+                                                              'deterministic (observations).')
 
-        dim_z = series.width
+        dim_z = series[0].width
+        raise_if_not(all(s.width == dim_z for s in series), 'All the series must have the same width to be '
+                                                            'filtered together.', logger)
 
+        # the recursion only reads the matrices of the filter, so there is no need to copy a provided `kf`
         if not self.kf_provided:
-            kf = FpKalmanFilter(dim_x=self.dim_x, dim_z=dim_z)
-            kf.x = self.x_init
-            kf.P = self.P
-            kf.Q = self.Q
-            kf.R = self.R if self.R is not None else np.eye(dim_z)
-            kf.H = self.H if self.H is not None else np.ones((dim_z, self.dim_x))
-            kf.F = self.F
+            x, P, F, Q = self.x_init, self.P, self.F, self.Q
+            R = self.R if self.R is not None else np.eye(dim_z)
+            H = self.H if self.H is not None else np.ones((dim_z, self.dim_x))
+            alpha = 1.
         else:
             raise_if_not(dim_z == self.kf.dim_z, 'The provided TimeSeries dimensionality does not match '
                                                  'the filter observation dimensionality dim_z.')
-            kf = deepcopy(self.kf)
+            x, P, F, Q, R, H, alpha = self.kf.x, self.kf.P, self.kf.F, self.kf.Q, self.kf.R, self.kf.H, self.kf.alpha
 
-        super().filter(series)
-        values = series.values(copy=False)
+        for s in series:
+            super().filter(s)
+        all_values = [s.values(copy=False) for s in series]
+        dtype = np.float32 if all(values.dtype == np.float32 for values in all_values) else np.float64
 
-        # For each time step, we'll sample "n_samples" from a multivariate Gaussian
-        # whose mean vector and covariance matrix come from the Kalman filter.
-        if num_samples == 1:
-            sampled_states = np.zeros(((len(values)), self.dim_x, ))
+        # cast the matrices of the filter once, to the precision of the series and with fixed 2-D shapes
+        # (the filter parameters can also be given as scalars)
+        F = _as_matrix(F, (self.dim_x, self.dim_x), dtype, scalar_as_identity=True)
+        H = _as_matrix(H, (dim_z, self.dim_x), dtype, scalar_as_identity=True)
+        P_init = _as_matrix(P, (self.dim_x, self.dim_x), dtype, scalar_as_identity=True)
+        Q = _as_matrix(Q, (self.dim_x, self.dim_x), dtype, scalar_as_identity=False)
+        R = _as_matrix(R, (dim_z, dim_z), dtype, scalar_as_identity=False)
+        x_init = np.array(x, dtype=dtype).reshape(self.dim_x)
+
+        if parallel:
+            raise_if_not(alpha == 1, 'The parallel Kalman filter does not support fading memory (alpha != 1).',
+                         logger)
+            results = [_run_kf_parallel(np.ascontiguousarray(values, dtype=dtype), F, Q, H, R, x_init, P_init)
+                       for values in all_values]
+            if num_samples > 1:
+                results = [(means, self._cholesky(covs)) for means, covs in results]
         else:
-            sampled_states = np.zeros(((len(values)), self.dim_x, num_samples))
+            # the observations of all the series are stacked in an array of shape (n_timesteps, dim_z, n_series),
+            # padded with zeros after the end of the shorter series (their states are discarded there)
+            lengths = [len(values) for values in all_values]
+            z_values = np.zeros((max(lengths), dim_z, len(series)), dtype=dtype)
+            for idx, values in enumerate(all_values):
+                z_values[:lengths[idx], :, idx] = values
 
-        # process_means = np.zeros((len(values), self.dim_x))  # mean values
-        # process_covariances = ...                            # covariance matrices; TODO
-        for i in range(len(values)):
-            obs = values[i, :]
-            kf.predict()
-            kf.update(obs)
-            mean_vec = kf.x.reshape(self.dim_x,)
+            # with independent measurement noises, the measurements can be processed one by one
+            sequential = not np.any(R - np.diag(np.diag(R)))
+            steady_state_tol = 100 * np.finfo(dtype).eps
+            means, covs = _run_kf(z_values, F, Q, H, R, dtype(alpha ** 2), x_init, P_init,
+                                  num_samples > 1, sequential, steady_state_tol)
+            if num_samples > 1:
+                # the covariances are shared by all the series, so they are only factorized once
+                covs = self._cholesky(covs)
+            results = [(means[:length, :, idx], covs[:length]) for idx, length in enumerate(lengths)]
 
+        filtered_series = []
+        for s, (means, Ls) in zip(series, results):
+            # For each time step, we'll sample "n_samples" from a multivariate Gaussian
+            # whose mean vector and covariance matrix (given by its Cholesky factor) come from the Kalman filter.
             if num_samples == 1:
                 # It's actually not sampled in this case
-                sampled_states[i, :] = mean_vec
+                sampled_states = means
             else:
-                cov_matrix = kf.P
-                sampled_states[i, :, :] = np.random.multivariate_normal(mean_vec, cov_matrix, size=num_samples).T
+                # The noise for all time steps is drawn at once
+                noise = np.random.standard_normal((len(means), self.dim_x, num_samples)).astype(dtype, copy=False)
+                sampled_states = means[:, :, None] + Ls @ noise
+
+            filtered_series.append(TimeSeries.from_times_and_values(s.time_index, sampled_states))
 
         # TODO: later on for a forecasting model we'll have to do something like
         """
@@ -159,4 +456,4 @@ class KalmanFilter(FilteringModel, ABC):
             preds_cov.append(kf.H.dot(kf.P).dot(kf.H.T))
         """
 
-        return TimeSeries.from_times_and_values(series.time_index, sampled_states)
+        return filtered_series[0] if called_with_single_series else filtered_series
@@ -1,13 +1,38 @@
+import unittest
+
 import numpy as np
 import pandas as pd
 from sklearn.gaussian_process.kernels import RBF, ExpSineSquared
+from filterpy.kalman import KalmanFilter as FpKalmanFilter
 
 from darts.models import GaussianProcessFilter
 from darts.models.filtering.moving_average import MovingAverage
-from darts.models.filtering.kalman_filter import KalmanFilter
+from darts.models.filtering.kalman_filter import KalmanFilter, _run_kf, _jax_precision
 from darts import TimeSeries
 from darts.utils import timeseries_generation as tg
 from darts.tests.base_test_class import DartsBaseTestClass
+from darts.logging import get_logger
+
+logger = get_logger(__name__)
+
+try:
+    from numba import config as numba_config
+    from numba.core.dispatcher import Dispatcher
+
+    NUMBA_AVAILABLE = not numba_config.DISABLE_JIT
+except ImportError:
+    logger.warning("numba not installed - jit-compiled Kalman filter tests will be skipped")
+    NUMBA_AVAILABLE = False
+
+try:
+    import jax
+
+    # the parallel filter also needs to switch the precision of jax
+    _jax_precision(jax, True)
+    JAX_AVAILABLE = True
+except ImportError:
+    logger.warning("jax not installed (or not supported) - parallel Kalman filter tests will be skipped")
+    JAX_AVAILABLE = False
 
 
 class FilterBaseTestClass(DartsBaseTestClass):
@@ -54,6 +79,145 @@ class KalmanFilterTestCase(FilterBaseTestClass):
 
         self.assertEqual(prediction.width, 3)
 
+    def test_kalman_matches_filterpy(self):
+        """The filtered states must match those obtained by stepping through filterpy's KalmanFilter.
+        The series is long enough for the filter to reach its steady state.
+        """
+        sine_ts = tg.sine_timeseries(length=200, value_frequency=0.1)
+        noise_ts = tg.gaussian_timeseries(length=200) * 0.1
+        ts = sine_ts.stack(noise_ts)
+
+        # correlated (full update) and independent (sequential update) measurement noises
+        for R in [np.array([[0.5, 0.1], [0.1, 0.3]]), np.diag([0.5, 0.3])]:
+            fp_kf = FpKalmanFilter(dim_x=3, dim_z=2)
+            fp_kf.x = np.zeros(3)
+            fp_kf.F = np.array([[1., 0.1, 0.], [0., 1., 0.], [0., 0., 0.9]])
+            fp_kf.H = np.array([[1., 0., 0.], [0., 0.5, 1.]])
+            fp_kf.R = R
+            fp_kf.Q = 0.1 * np.eye(3)
+
+            kf = KalmanFilter(kf=fp_kf)
+            filtered_values = kf.filter(ts).values()
+
+            expected_values = []
+            for obs in ts.values():
+                fp_kf.predict()
+                fp_kf.update(obs)
+                expected_values.append(fp_kf.x.copy())
+
+            np.testing.assert_allclose(filtered_values, np.array(expected_values))
+
+    def test_kalman_scalar_matrices(self):
+        """Scalar filter matrices must be interpreted the same way as filterpy does."""
+        sine_ts = tg.sine_timeseries(length=50, value_frequency=0.1)
+        noise_ts = tg.gaussian_timeseries(length=50) * 0.1
+        ts = sine_ts.stack(noise_ts)
+
+        F, H = np.array([[0.9, 0.1], [0., 1.]]), np.array([[1., 0.], [0.5, 2.]])
+        fp_kf = FpKalmanFilter(dim_x=2, dim_z=2)
+        fp_kf.x = np.zeros(2)
+        fp_kf.P, fp_kf.Q, fp_kf.F, fp_kf.H = 10., 0.5, F, H
+        expected_values = []
+        for obs in ts.values():
+            fp_kf.predict()
+            fp_kf.update(obs)
+            expected_values.append(fp_kf.x.copy())
+
+        kf = KalmanFilter(dim_x=2, P=10., Q=0.5, F=F, H=H)
+        np.testing.assert_allclose(kf.filter(ts).values(), np.array(expected_values))
+
+    def test_kalman_scalar_noises(self):
+        """The scalar parameters of the Kalman filter example notebook must give the same states as filterpy."""
+        x = np.cumsum(np.random.normal(0, 2, 100)) + np.random.normal(0, 7, 100)
+
+        fp_kf = FpKalmanFilter(dim_x=1, dim_z=1)
+        fp_kf.x = np.zeros(1)
+        fp_kf.H = np.ones((1, 1))
+        fp_kf.P, fp_kf.R, fp_kf.Q = 1000., 50, 1
+        expected_values = []
+        for obs in x:
+            fp_kf.predict()
+            fp_kf.update(obs)
+            expected_values.append(fp_kf.x.copy())
+
+        filtered_x = KalmanFilter(P=1000., R=50, Q=1).filter(TimeSeries.from_values(x)).values()
+        np.testing.assert_allclose(filtered_x, np.array(expected_values))
+
+    def test_kalman_multiple_series(self):
+        """Filtering several series together must give the same states as filtering them one by one."""
+        kf = KalmanFilter(dim_x=3, F=np.array([[1., 0.1, 0.], [0., 1., 0.], [0., 0., 0.9]]), Q=0.1 * np.eye(3))
+
+        series = []
+        for length in [50, 80, 30]:
+            sine_ts = tg.sine_timeseries(length=length, value_frequency=0.1)
+            noise_ts = tg.gaussian_timeseries(length=length) * 0.1
+            series.append(sine_ts.stack(noise_ts))
+
+        filtered_series = kf.filter(series)
+        self.assertEqual(len(filtered_series), 3)
+        for ts, filtered_ts in zip(series, filtered_series):
+            self.assertEqual(filtered_ts.time_index.equals(ts.time_index), True)
+            np.testing.assert_allclose(filtered_ts.values(), kf.filter(ts).values())
+
+        sampled_series = kf.filter(series, num_samples=10)
+        self.assertEqual([s.all_values().shape for s in sampled_series], [(50, 3, 10), (80, 3, 10), (30, 3, 10)])
+
+        with self.assertRaises(ValueError):
+            kf.filter([])
+
+    @unittest.skipUnless(NUMBA_AVAILABLE, "requires numba")
+    def test_kalman_jit_compiled(self):
+        """With numba installed, the Kalman recursion (and so the other tests) runs as jit-compiled code."""
+        self.assertIsInstance(_run_kf, Dispatcher)
+
+    def test_kalman_float32(self):
+        """A float32 series is filtered in single precision, with results close to the double precision ones."""
+        kf = KalmanFilter(dim_x=3)
+
+        sine_ts = tg.sine_timeseries(length=100, value_frequency=0.1)
+        noise_ts = tg.gaussian_timeseries(length=100) * 0.1
+        ts = sine_ts.stack(noise_ts)
+        ts_32 = TimeSeries.from_values(ts.values().astype(np.float32))
+
+        filtered_values = kf.filter(ts).values()
+        filtered_values_32 = kf.filter(ts_32).values()
+        sampled_values_32 = kf.filter(ts_32, num_samples=10).all_values()
+
+        self.assertEqual(filtered_values_32.dtype, np.float32)
+        self.assertEqual(sampled_values_32.dtype, np.float32)
+        np.testing.assert_allclose(filtered_values_32, filtered_values, atol=1e-4)
+
+    @unittest.skipUnless(JAX_AVAILABLE, "requires jax")
+    def test_kalman_parallel(self):
+        """The parallel Kalman filter must give the same states distribution as the sequential one."""
+        kf = KalmanFilter(dim_x=3, F=np.array([[1., 0.1, 0.], [0., 1., 0.], [0., 0., 0.9]]), Q=0.1 * np.eye(3),
+                          R=np.array([[0.5, 0.1], [0.1, 0.3]]))
+
+        sine_ts = tg.sine_timeseries(length=100, value_frequency=0.1)
+        noise_ts = tg.gaussian_timeseries(length=100) * 0.1
+        ts = sine_ts.stack(noise_ts)
+
+        filtered_values = kf.filter(ts).values()
+        filtered_values_parallel = kf.filter(ts, parallel=True).values()
+        np.testing.assert_allclose(filtered_values_parallel, filtered_values, atol=1e-8)
+
+        samples = kf.filter(ts, num_samples=5000, parallel=True).all_values()
+        np.testing.assert_allclose(samples.mean(axis=2), filtered_values, atol=0.1)
+
+    def test_kalman_samples(self):
+        """The samples of the filtered states must be centered around the filtered state means."""
+        kf = KalmanFilter(dim_x=2, F=np.array([[1., 1.], [0., 1.]]), Q=0.01 * np.eye(2))
+
+        sine_ts = tg.sine_timeseries(length=40, value_frequency=0.05)
+        noise_ts = tg.gaussian_timeseries(length=40) * 0.1
+        ts = sine_ts + noise_ts
+
+        means = kf.filter(ts).values()
+        samples = kf.filter(ts, num_samples=5000).all_values()
+
+        self.assertEqual(samples.shape, (40, 2, 5000))
+        np.testing.assert_allclose(samples.mean(axis=2), means, atol=0.1)
+
 
 class MovingAverageTestCase(FilterBaseTestClass):
     def test_moving_average_univariate(self):
@@ -1,3 +1,5 @@
+from collections.abc import Sequence
+
 import pandas as pd
 import numpy as np
 
@@ -1072,6 +1074,61 @@ if TORCH_AVAILABLE:
             with self.assertRaises(ValueError):
                 ds[0]
 
+        def test_sequence_with_lengths(self):
+            # the lengths exposed by the sequence are used instead of reading all series
+            class SeriesSequence(list):
+                lengths = [100, 150]
+
+                def __iter__(self):
+                    raise AssertionError("the series should not be read")
+
+            ds = PastCovariatesSequentialDataset(
+                target_series=SeriesSequence([self.target1, self.target2]),
+                input_chunk_length=10,
+                output_chunk_length=10,
+            )
+            self.assertEqual(len(ds), 262)
+            self._assert_eq(
+                ds[136], (self.target2[125:135], None, self.target2[135:145])
+            )
+
+        def test_lazy_sequence_not_stored(self):
+            # the series of a sequence other than a list or tuple are read again at each access
+            class LazySequence(Sequence):
+                def __init__(self, series):
+                    self.series = series
+                    self.n_reads = 0
+
+                def __len__(self):
+                    return len(self.series)
+
+                def __getitem__(self, idx):
+                    self.n_reads += 1
+                    return self.series[idx]
+
+            target_series = LazySequence([self.target1, self.target2])
+            ds = PastCovariatesSequentialDataset(
+                target_series=target_series,
+                input_chunk_length=10,
+                output_chunk_length=10,
+                max_samples_per_ts=100,
+            )
+            self._assert_eq(ds[5], (self.target1[75:85], None, self.target1[85:95]))
+            n_reads = target_series.n_reads
+            self._assert_eq(ds[5], (self.target1[75:85], None, self.target1[85:95]))
+            self.assertGreater(target_series.n_reads, n_reads)
+
+        def test_samples_are_writable(self):
+            # the samples are slices of the series values, and must stay writable (e.g. for torch collate)
+            ds = PastCovariatesSequentialDataset(
+                target_series=[self.target1, self.target2],
+                covariates=[self.cov1, self.cov2],
+                input_chunk_length=10,
+                output_chunk_length=10,
+            )
+            for arr in ds[5]:
+                self.assertTrue(arr.flags.writeable)
+
         def test_horizon_based_dataset(self):
             # one target series
             ds = HorizonBasedDataset(
@@ -3,7 +3,8 @@ Shifted Training Dataset
 ------------------------
 """
 
-from typing import Union, Sequence, Optional, Tuple
+import time
+from typing import Union, Sequence, Optional, Tuple, Dict
 import numpy as np
 
 from darts import TimeSeries
@@ -14,7 +15,9 @@ from .training_dataset import (TrainingDataset,
                                DualCovariatesTrainingDataset,
                                MixedCovariatesTrainingDataset,
                                SplitCovariatesTrainingDataset)
-from darts.logging import raise_if_not
+from darts.logging import get_logger, raise_if_not
+
+logger = get_logger(__name__)
 
 
 class PastCovariatesShiftedDataset(PastCovariatesTrainingDataset):
@@ -409,7 +412,9 @@ class GenericShiftedDataset(TrainingDataset):
         Parameters
         ----------
         target_series
-            One or a sequence of target `TimeSeries`.
+            One or a sequence of target `TimeSeries`. If the target series and covariates are provided as lists
+            (or tuples), the dataset keeps (views of) their values after their first access. Other sequences are
+            indexed again at each access, so that they can load their series lazily.
         covariates
             Optionally, one or a sequence of `TimeSeries` containing covariates.
         input_chunk_length
@@ -425,7 +430,9 @@ class GenericShiftedDataset(TrainingDataset):
             This is an upper bound on the number of (input, output, input_covariates) tuples that can be produced
             per time series. It can be used in order to have an upper bound on the total size of the dataset and
             ensure proper sampling. If `None`, it will read all of the individual time series in advance (at dataset
-            creation) to know their sizes, which might be expensive on big datasets.
+            creation) to know their sizes, which might be expensive on big datasets (for instance if the series are
+            loaded lazily from disk). This can be avoided by passing as `target_series` a sequence exposing the
+            lengths of its series through a `lengths` attribute.
             If some series turn out to have a length that would allow more than `max_samples_per_ts`, only the
             most recent `max_samples_per_ts` samples will be considered.
         covariate_type
@@ -447,40 +454,91 @@ class GenericShiftedDataset(TrainingDataset):
 
         self.size_of_both_chunks = max(self.input_chunk_length, self.shift + self.output_chunk_length)
 
+        # lengths of the target series, if the sequence provides them without having to read the series
+        self._target_lengths: Optional[Sequence[int]] = getattr(self.target_series, 'lengths', None)
+
         if self.max_samples_per_ts is None:
-            # read all time series to get the maximum size
-            self.max_samples_per_ts = max(len(ts) for ts in self.target_series) - \
-                                      self.size_of_both_chunks + 1
+            if self._target_lengths is None:
+                # read all time series to get the maximum size
+                start_time = time.perf_counter()
+                self._target_lengths = [len(ts) for ts in self.target_series]
+                elapsed_time = time.perf_counter() - start_time
+                if elapsed_time > 1:
+                    logger.warning(f'Reading all the target series to get their lengths took {elapsed_time:.1f}s. '
+                                   f'This can be avoided by specifying `max_samples_per_ts`.')
+
+            self.max_samples_per_ts = max(self._target_lengths) - self.size_of_both_chunks + 1
 
         self.ideal_nr_samples = len(self.target_series) * self.max_samples_per_ts
 
+        self._main_cov_type = CovariateType.NONE
+        if self.covariates is not None:
+            self._main_cov_type = CovariateType.FUTURE if self.shift_covariates else CovariateType.PAST
+        self._cov_chunk_length = self.output_chunk_length if self.shift_covariates else self.input_chunk_length
+
+        # actual number of possible samples in each time series, stored the first time the series is accessed
+        # (the positions of the chunks are stored in `self._index_memory`, see `TrainingDataset._memory_indexer()`)
+        self._n_samples_in_ts: Dict[int, int] = {}
+
+        # values of the target and covariate series, stored the first time the series are accessed. This is only
+        # done for series held in memory by a list or tuple: the stored values are views of the series data, so
+        # they don't use more memory. Other sequences (which may load their series lazily) are read at each access.
+        self._values_memory: Optional[Dict[int, Tuple[np.ndarray, Optional[np.ndarray]]]] = None
+        if isinstance(self.target_series, (list, tuple)) and \
+                (self.covariates is None or isinstance(self.covariates, (list, tuple))):
+            self._values_memory = {}
+
     def __len__(self):
         return self.ideal_nr_samples
 
+    def _get_n_samples_in_ts(self, ts_idx: int) -> int:
+        """Returns the actual number of possible samples in the `ts_idx`-th target series."""
+        n_samples_in_ts = self._n_samples_in_ts.get(ts_idx)
+        if n_samples_in_ts is None:
+            ts_length = self._target_lengths[ts_idx] if self._target_lengths is not None else \
+                len(self.target_series[ts_idx])
+            n_samples_in_ts = ts_length - self.size_of_both_chunks + 1
+
+            raise_if_not(n_samples_in_ts >= 1,
+                         'The dataset contains some time series that are too short to contain '
+                         '`max(self.input_chunk_length, self.shift + self.output_chunk_length)` '
+                         '({}-th series)'.format(ts_idx))
+
+            self._n_samples_in_ts[ts_idx] = n_samples_in_ts
+        return n_samples_in_ts
+
+    def _get_values(self, ts_idx: int) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """Returns (views of) the values of the `ts_idx`-th target and covariate series."""
+        values = self._values_memory.get(ts_idx) if self._values_memory is not None else None
+        if values is None:
+            target_vals = self.target_series[ts_idx].values(copy=False)
+            covariate_vals = None
+            if self.covariates is not None:
+                covariate_vals = self.covariates[ts_idx].values(copy=False)
+
+            values = (target_vals, covariate_vals)
+            if self._values_memory is not None:
+                self._values_memory[ts_idx] = values
+        return values
+
     def __getitem__(self, idx) -> Tuple[np.ndarray, Optional[np.ndarray], np.ndarray]:
         # determine the index of the time series.
         ts_idx = idx // self.max_samples_per_ts
-        ts_target = self.target_series[ts_idx]
-        target_vals = ts_target.values(copy=False)
+        target_vals, covariate_vals = self._get_values(ts_idx)
 
         # determine the actual number of possible samples in this time series
-        n_samples_in_ts = len(target_vals) - self.size_of_both_chunks + 1
-
-        raise_if_not(n_samples_in_ts >= 1,
-                     'The dataset contains some time series that are too short to contain '
-                     '`max(self.input_chunk_length, self.shift + self.output_chunk_length)` '
-                     '({}-th series)'.format(ts_idx))
+        n_samples_in_ts = self._get_n_samples_in_ts(ts_idx)
 
-        # determine the index at the end of the output chunk
+        # determine the position of the sample, counted from the most recent one
         # it is originally in [0, self.max_samples_per_ts), so we use a modulo to have it in [0, n_samples_in_ts)
-        end_of_output_idx = len(ts_target) - (idx - (ts_idx * self.max_samples_per_ts)) % n_samples_in_ts
+        lh_idx = (idx % self.max_samples_per_ts) % n_samples_in_ts
 
-        # optionally, load covariates
-        ts_covariate = self.covariates[ts_idx] if self.covariates is not None else None
-
-        main_cov_type = CovariateType.NONE
-        if self.covariates is not None:
-            main_cov_type = CovariateType.FUTURE if self.shift_covariates else CovariateType.PAST
+        # the series themselves are only needed the first time the series is accessed, to align the covariates
+        # on the target; the indices are then read from `self._index_memory`
+        ts_target, ts_covariate = None, None
+        if ts_idx not in self._index_memory:
+            ts_target = self.target_series[ts_idx]
+            ts_covariate = self.covariates[ts_idx] if self.covariates is not None else None
 
         # get all indices for the current sample
         past_start, past_end, future_start, future_end, cov_start, cov_end = \
@@ -489,9 +547,9 @@ class GenericShiftedDataset(TrainingDataset):
                                  shift=self.shift,
                                  input_chunk_length=self.input_chunk_length,
                                  output_chunk_length=self.output_chunk_length,
-                                 end_of_output_idx=end_of_output_idx,
+                                 end_of_output_idx=len(target_vals) - lh_idx,
                                  ts_covariate=ts_covariate,
-                                 cov_type=main_cov_type)
+                                 cov_type=self._main_cov_type)
 
         # extract sample target
         future_target = target_vals[future_start:future_end]
@@ -499,16 +557,15 @@ class GenericShiftedDataset(TrainingDataset):
 
         # optionally, extract sample covariates
         covariate = None
-        if self.covariates is not None:
-            raise_if_not(cov_end <= len(ts_covariate),
-                         f"The dataset contains {main_cov_type.value} covariates "
+        if covariate_vals is not None:
+            raise_if_not(cov_end <= len(covariate_vals),
+                         f"The dataset contains {self._main_cov_type.value} covariates "
                          f"that don't extend far enough into the future. ({idx}-th sample)")
 
-            covariate = ts_covariate.values(copy=False)[cov_start:cov_end]
+            covariate = covariate_vals[cov_start:cov_end]
 
-            raise_if_not(len(covariate) == (self.output_chunk_length if self.shift_covariates else
-                                            self.input_chunk_length),
-                         f"The dataset contains {main_cov_type.value} covariates "
+            raise_if_not(len(covariate) == self._cov_chunk_length,
+                         f"The dataset contains {self._main_cov_type.value} covariates "
                          f"whose time axis doesn't allow to obtain the input (or output) chunk relative to the "
                          f"target series.")
 